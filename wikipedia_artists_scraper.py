@@ -1,150 +1,518 @@
-import requests
+import asyncio
+import aiohttp
+from collections import deque
 import json
+import os
+import random
+import sqlite3
+import time
 from urllib.parse import quote
 import html
-import time
 
-def get_category_members(category_name, language='he'):
+# orjson decodes the larger API responses several times faster
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# PyICU sorts titles by Hebrew collation rules rather than by code point
+try:
+    from icu import Collator, Locale
+    COLLATOR = Collator.createInstance(Locale('he'))
+except ImportError:
+    COLLATOR = None
+
+# Responses worth retrying, and how many times to retry them. MediaWiki
+# reports some throttling as an error object in a successful response
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_ERROR_CODES = {'ratelimited', 'maxlag', 'readonly'}
+MAX_RETRIES = 5
+
+# The query service reports query timeouts as HTTP 500, so only retry it
+# when it asks us to back off, and give up quickly so the API fallback
+# can take over
+SPARQL_RETRY_STATUSES = {429, 503}
+SPARQL_MAX_RETRIES = 1
+
+# Identify the script to Wikimedia, as required by its User-Agent policy
+USER_AGENT = 'missingwikiartistsmb/1.0 (https://github.com/YoGo9/missingwikiartistsmb)'
+
+# Where lookups are cached between runs, and for how long (in seconds)
+CACHE_PATH = os.path.expanduser('~/.cache/missingwikiartistsmb.sqlite')
+CACHE_TTL = 7 * 24 * 60 * 60
+
+class LookupCache:
+    """
+    On-disk SQLite cache for API lookups, keyed by lookup kind and key
+    """
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS lookups ('
+            'kind TEXT, key TEXT, value TEXT, fetched_at REAL, '
+            'PRIMARY KEY (kind, key))'
+        )
+    
+    def get_many(self, kind, keys):
+        """
+        Return a dict of the keys that have a fresh cached value
+        """
+        results = {}
+        min_fetched_at = time.time() - self.ttl
+        keys = list(keys)
+        
+        # Stay well below SQLite's limit on query parameters
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = self.conn.execute(
+                f'SELECT key, value FROM lookups WHERE kind = ? '
+                f'AND fetched_at >= ? AND key IN ({placeholders})',
+                [kind, min_fetched_at, *batch]
+            )
+            for key, value in rows:
+                results[key] = json.loads(value)
+        
+        return results
+    
+    def set_many(self, kind, values):
+        """
+        Store a dict of freshly fetched values
+        """
+        fetched_at = time.time()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?)',
+                [(kind, key, json.dumps(value), fetched_at) for key, value in values.items()]
+            )
+    
+    def close(self):
+        self.conn.close()
+
+class AdaptiveLimiter:
+    """
+    Admission control for API requests with AIMD concurrency
+
+    The number of in-flight requests grows by one per round of requests
+    while responses are fast, and is halved when the server throttles us
+    or the average latency goes over the target.
+    """
+    def __init__(self, initial=8, maximum=16, target_latency=3.0):
+        self.concurrency = initial
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.avg_latency = None
+        self.last_decrease = 0
+        self.in_flight = 0
+        self.waiters = deque()
+    
+    async def acquire(self):
+        """
+        Wait for a free request slot and take it
+        """
+        while self.in_flight >= int(self.concurrency):
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+        
+        self.in_flight += 1
+    
+    def release(self):
+        """
+        Give back a request slot
+        """
+        self.in_flight -= 1
+        self.wake_waiters()
+    
+    def record(self, latency, throttled=False):
+        """
+        Adjust the concurrency to how a request went
+        """
+        if self.avg_latency is None:
+            self.avg_latency = latency
+        else:
+            self.avg_latency = 0.8 * self.avg_latency + 0.2 * latency
+        
+        if throttled or self.avg_latency > self.target_latency:
+            # Only back off once per round, as requests already in flight
+            # will report the same overload
+            now = time.monotonic()
+            if now - self.last_decrease > self.avg_latency:
+                self.concurrency = max(1, self.concurrency / 2)
+                self.last_decrease = now
+        else:
+            self.concurrency = min(self.maximum, self.concurrency + 1 / self.concurrency)
+            self.wake_waiters()
+    
+    def wake_waiters(self):
+        free = int(self.concurrency) - self.in_flight
+        while free > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+class RateLimiter:
+    """
+    Token bucket limiting how many API requests are started per second
+
+    The rate is halved when the server throttles us, at most once per
+    round of requests, and creeps back up by one request per second for
+    every second of successful requests.
+    """
+    def __init__(self, rps=10):
+        self.rps = rps
+        self.max_rps = rps
+        self.tokens = rps
+        self.updated = time.monotonic()
+        self.last_decrease = 0
+    
+    async def acquire(self):
+        """
+        Wait until a request may be started
+        """
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rps, self.tokens + (now - self.updated) * self.rps)
+            self.updated = now
+            
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            
+            await asyncio.sleep((1 - self.tokens) / self.rps)
+    
+    def record(self, latency, throttled=False):
+        """
+        Adjust the rate to how a request went
+        """
+        if throttled:
+            # Only back off once per round, as requests already in flight
+            # will report the same throttling
+            now = time.monotonic()
+            if now - self.last_decrease > max(1, latency):
+                self.rps = max(1, self.rps / 2)
+                self.tokens = min(self.tokens, self.rps)
+                self.last_decrease = now
+        else:
+            self.rps = min(self.max_rps, self.rps + 1 / self.rps)
+
+# Gate all requests to the Wikimedia APIs
+REQUEST_LIMITER = AdaptiveLimiter()
+RATE_LIMITER = RateLimiter()
+
+def create_session():
     """
-    Fetch all pages from a Wikipedia category
+    Create an HTTP session that keeps connections to the APIs alive
     """
-    members = []
-    continue_token = None
+    connector = aiohttp.TCPConnector(limit=16, keepalive_timeout=60)
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers={'User-Agent': USER_AGENT}
+    )
+
+def get_retry_delay(headers, attempt):
+    """
+    Get how long to wait before retrying a request, in seconds
+
+    Honors the Retry-After header if the server sent one, otherwise backs
+    off exponentially with some jitter
+    """
+    retry_after = headers.get('Retry-After', '')
+    if retry_after.isdigit():
+        return int(retry_after)
+    
+    return min(60, (1 << attempt) + random.random())
+
+async def fetch_json(session, url, params=None, data=None, headers=None,
+                     max_retries=MAX_RETRIES, retry_statuses=RETRY_STATUSES,
+                     adapt_limits=True):
+    """
+    Make a request to a Wikimedia API and return the decoded JSON
+
+    The request is a POST if form data is given, otherwise a GET.
+    Responses with one of retry_statuses, throttling API errors and
+    connection errors are retried up to max_retries times. Unless
+    adapt_limits is False, the response also tunes the shared limiters.
+    """
+    method = 'POST' if data is not None else 'GET'
+    
+    for attempt in range(max_retries + 1):
+        await REQUEST_LIMITER.acquire()
+        try:
+            await RATE_LIMITER.acquire()
+            throttled = False
+            start = time.monotonic()
+            try:
+                async with session.request(method, url, params=params, data=data, headers=headers) as response:
+                    throttled = response.status == 429
+                    if response.status in retry_statuses and attempt < max_retries:
+                        reason = f"HTTP {response.status}"
+                        delay = get_retry_delay(response.headers, attempt)
+                    else:
+                        response.raise_for_status()
+                        result = json_loads(await response.read())
+                        delay = None
+                        
+                        error = result.get('error') if isinstance(result, dict) else None
+                        if error and error.get('code') in RETRY_ERROR_CODES and attempt < max_retries:
+                            throttled = True
+                            reason = f"API error {error['code']}"
+                            delay = get_retry_delay(response.headers, attempt)
+            except aiohttp.ClientConnectionError as e:
+                if attempt == max_retries:
+                    raise
+                reason = e
+                delay = get_retry_delay({}, attempt)
+            finally:
+                if adapt_limits:
+                    latency = time.monotonic() - start
+                    REQUEST_LIMITER.record(latency, throttled=throttled)
+                    RATE_LIMITER.record(latency, throttled=throttled)
+        finally:
+            REQUEST_LIMITER.release()
+        
+        if delay is None:
+            return result
+        
+        print(f"Request to {url} failed ({reason}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+async def get_category_members(session, category_name, language='he'):
+    """
+    Fetch all pages from a Wikipedia category, along with their Wikidata IDs
+
+    Uses the category members as a generator for a pageprops query, so each
+    page comes back with its Wikidata ID (or None) in the same request.
+    Each page is only returned once.
+    """
+    members = {}
+    continue_params = {}
     
     while True:
         # Prepare API parameters
         params = {
             'action': 'query',
-            'list': 'categorymembers',
-            'cmtitle': f'Category:{category_name}',
-            'cmlimit': 'max',
-            'format': 'json'
+            'generator': 'categorymembers',
+            'gcmtitle': f'Category:{category_name}',
+            'gcmnamespace': '0',  # Only main namespace articles
+            'gcmlimit': 'max',
+            'prop': 'pageprops',
+            'ppprop': 'wikibase_item',
+            'format': 'json',
+            **continue_params
         }
         
-        if continue_token:
-            params['cmcontinue'] = continue_token
-        
         # Make API request
         url = f'https://{language}.wikipedia.org/w/api.php'
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = await fetch_json(session, url, params)
         
-        # Extract members
-        for member in data['query']['categorymembers']:
-            if member['ns'] == 0:  # Only main namespace articles
-                members.append({
-                    'title': member['title'],
-                    'pageid': member['pageid']
-                })
+        # Extract members, keeping any Wikidata ID already seen for a page
+        # that comes back again in a later batch
+        for page in data.get('query', {}).get('pages', {}).values():
+            # Missing pages have no pageid
+            if 'missing' in page or 'pageid' not in page:
+                continue
+            
+            member = members.setdefault(page['pageid'], {
+                'title': page['title'],
+                'pageid': page['pageid'],
+                'wikidata_id': None
+            })
+            if 'pageprops' in page:
+                member['wikidata_id'] = page['pageprops'].get('wikibase_item')
         
         # Check if there are more results
         if 'continue' in data:
-            continue_token = data['continue']['cmcontinue']
+            continue_params = data['continue']
         else:
             break
     
-    return members
+    return list(members.values())
 
-def get_wikidata_id(page_title, language='he'):
-    """
-    Get Wikidata ID for a Wikipedia page
+async def check_musicbrainz_ids(session, wikidata_ids, cache=None):
     """
-    params = {
-        'action': 'query',
-        'prop': 'pageprops',
-        'titles': page_title,
-        'format': 'json'
-    }
-    
-    url = f'https://{language}.wikipedia.org/w/api.php'
-    response = requests.get(url, params=params)
-    data = response.json()
-    
-    pages = data['query']['pages']
-    for page_id, page_data in pages.items():
-        if 'pageprops' in page_data and 'wikibase_item' in page_data['pageprops']:
-            return page_data['pageprops']['wikibase_item']
-    
-    return None
+    Check which Wikidata entities have a MusicBrainz artist ID (P434)
 
-def has_musicbrainz_id(wikidata_id):
-    """
-    Check if a Wikidata entity has a MusicBrainz artist ID (P434)
+    Looks up the entities in concurrent batches of 50, the maximum allowed
+    by wbgetentities, and returns a dict mapping each ID to True/False.
+    IDs from batches that failed are left out of the result. If a cache
+    is given, only IDs missing from it are fetched.
     """
-    if not wikidata_id:
-        return False
-    
-    params = {
-        'action': 'wbgetentities',
-        'ids': wikidata_id,
-        'props': 'claims',
-        'format': 'json'
-    }
-    
+    results = {}
+    ids = [wikidata_id for wikidata_id in dict.fromkeys(wikidata_ids) if wikidata_id]
     url = 'https://www.wikidata.org/w/api.php'
-    response = requests.get(url, params=params)
-    data = response.json()
+    cache_kind = 'has_musicbrainz_id'
+    
+    if cache:
+        results.update(cache.get_many(cache_kind, ids))
+    missing = [wikidata_id for wikidata_id in ids if wikidata_id not in results]
+    
+    async def fetch_batch(batch):
+        params = {
+            'action': 'wbgetentities',
+            'ids': '|'.join(batch),
+            'props': 'claims',
+            'format': 'json'
+        }
+        
+        try:
+            data = await fetch_json(session, url, params)
+        except Exception as e:
+            print(f"Error checking MusicBrainz IDs for {batch[0]}..{batch[-1]}: {e}")
+            return
+        
+        # The API can report errors in a successful response
+        if 'entities' not in data:
+            print(f"Error checking MusicBrainz IDs for {batch[0]}..{batch[-1]}: {data.get('error')}")
+            return
+        
+        # Redirected IDs come back under the ID they redirect to
+        batch_results = {
+            entity.get('redirects', {}).get('from', wikidata_id): 'P434' in (entity.get('claims') or {})
+            for wikidata_id, entity in data['entities'].items()
+        }
+        
+        results.update(batch_results)
+        if cache:
+            cache.set_many(cache_kind, batch_results)
     
-    if wikidata_id in data['entities']:
-        entity = data['entities'][wikidata_id]
-        if 'claims' in entity and 'P434' in entity['claims']:
-            return True
+    await asyncio.gather(*(
+        fetch_batch(missing[start:start + 50])
+        for start in range(0, len(missing), 50)
+    ))
     
-    return False
+    return results
 
-def filter_artists_without_musicbrainz(artists, language='he'):
+async def filter_artists_without_musicbrainz(session, artists, cache=None):
     """
     Filter artists to only those without MusicBrainz IDs
+
+    The artists are checked in concurrent batches of 50
     """
-    artists_without_mb = []
     total = len(artists)
+    checked = 0
     
     print(f"Checking {total} artists for MusicBrainz IDs...")
     
-    for i, artist in enumerate(artists, 1):
-        # Show progress
-        if i % 10 == 0:
-            print(f"Progress: {i}/{total} ({i/total*100:.1f}%)")
+    async def check_batch(batch):
+        nonlocal checked
         
-        try:
-            # Get Wikidata ID
-            wikidata_id = get_wikidata_id(artist['title'], language)
-            
-            if wikidata_id:
-                # Check if has MusicBrainz ID
-                if not has_musicbrainz_id(wikidata_id):
-                    artists_without_mb.append({
-                        'title': artist['title'],
-                        'pageid': artist['pageid'],
-                        'wikidata_id': wikidata_id
-                    })
-            else:
-                # No Wikidata ID means no MusicBrainz ID
-                artists_without_mb.append({
-                    'title': artist['title'],
-                    'pageid': artist['pageid'],
-                    'wikidata_id': None
-                })
-            
-            # Be nice to the APIs
-            time.sleep(0.1)
-            
-        except Exception as e:
-            print(f"Error checking {artist['title']}: {e}")
-            # Include in results as we couldn't verify
-            artists_without_mb.append({
+        has_mb = await check_musicbrainz_ids(
+            session, [artist['wikidata_id'] for artist in batch], cache
+        )
+        
+        # No Wikidata ID means no MusicBrainz ID, and IDs we couldn't verify
+        # are included in the results marked as errors
+        batch_without_mb = [
+            {
                 'title': artist['title'],
                 'pageid': artist['pageid'],
-                'wikidata_id': 'error'
-            })
+                'wikidata_id': (
+                    artist['wikidata_id']
+                    if not artist['wikidata_id'] or artist['wikidata_id'] in has_mb
+                    else 'error'
+                )
+            }
+            for artist in batch
+            if not has_mb.get(artist['wikidata_id'], False)
+        ]
+        
+        # Show progress
+        checked += len(batch)
+        print(f"Progress: {checked}/{total} ({checked/total*100:.1f}%)")
+        
+        return batch_without_mb
+    
+    batches = await asyncio.gather(*(
+        check_batch(artists[start:start + 50])
+        for start in range(0, total, 50)
+    ))
     
-    return artists_without_mb
+    return [artist for batch in batches for artist in batch]
+
+# Lists the articles in a Wikipedia category whose Wikidata item (if any)
+# has no MusicBrainz artist ID (P434). The category members and their
+# Wikidata items come from the query service's MediaWiki API service, which
+# leaves ?item unbound for articles without one.
+SPARQL_QUERY = """
+SELECT ?title ?pageid ?item WHERE {
+  SERVICE wikibase:mwapi {
+    bd:serviceParam wikibase:endpoint "%(language)s.wikipedia.org" ;
+                    wikibase:api "Generator" ;
+                    mwapi:generator "categorymembers" ;
+                    mwapi:gcmtitle "Category:%(category)s" ;
+                    mwapi:gcmnamespace "0" ;
+                    mwapi:gcmlimit "max" ;
+                    mwapi:prop "pageprops" ;
+                    mwapi:ppprop "wikibase_item" .
+    ?title wikibase:apiOutput mwapi:title .
+    ?pageid wikibase:apiOutput "@pageid" .
+    ?item wikibase:apiOutputItem mwapi:item .
+  }
+  FILTER(!BOUND(?item) || NOT EXISTS { ?item wdt:P434 [] })
+}
+ORDER BY ?title
+"""
 
-def generate_html(artists, category_name):
+async def fetch_artists_without_mb_sparql(session, category_name, language='he'):
     """
-    Generate an HTML page with artist links (only those without MusicBrainz)
+    Fetch the artists in a category without MusicBrainz IDs in one SPARQL query
     """
-    html_content = f"""
+    def escape(value):
+        return value.replace('\\', '\\\\').replace('"', '\\"')
+    
+    query = SPARQL_QUERY % {
+        'language': escape(language),
+        'category': escape(category_name)
+    }
+    
+    data = await fetch_json(
+        session,
+        'https://query.wikidata.org/sparql',
+        data={'query': query},
+        headers={'Accept': 'application/sparql-results+json'},
+        max_retries=SPARQL_MAX_RETRIES,
+        retry_statuses=SPARQL_RETRY_STATUSES,
+        # A long-running query says nothing about how loaded the APIs are
+        adapt_limits=False
+    )
+    
+    # A page can be listed more than once, so keep one result per page
+    artists_without_mb = {}
+    for binding in data['results']['bindings']:
+        item = binding.get('item')
+        pageid = int(binding['pageid']['value'])
+        artists_without_mb.setdefault(pageid, {
+            'title': binding['title']['value'],
+            'pageid': pageid,
+            'wikidata_id': item['value'].rsplit('/', 1)[-1] if item else None
+        })
+    
+    return list(artists_without_mb.values())
+
+# Table row for a single artist in the HTML page
+ROW_TEMPLATE = """
+            <tr>
+                <td>{i}</td>
+                <td>{name}</td>
+                <td><a href="https://he.wikipedia.org/wiki/{quoted_name}" target="_blank">לדף ויקיפדיה</a></td>
+                <td class="wikidata-status">{wikidata_cell}</td>
+                <td><a href="https://musicbrainz.org/search?query={quoted_name}&type=artist&method=indexed" target="_blank" class="musicbrainz-link">חיפוש והוספה</a></td>
+            </tr>
+"""
+
+WIKIDATA_CELL_TEMPLATE = '<a href="https://www.wikidata.org/wiki/{wikidata_id}" target="_blank">{wikidata_id}</a>'
+
+# Start of the HTML page, up to the table rows
+HTML_HEADER_TEMPLATE = """
 <!DOCTYPE html>
 <html lang="he" dir="rtl">
 <head>
@@ -214,7 +582,7 @@ def generate_html(artists, category_name):
 <body>
     <h1>{category_name}</h1>
     <div class="subtitle">אמנים שאין להם מזהה MusicBrainz בוויקינתונים</div>
-    <div class="stats">נמצאו {len(artists)} אמנים ללא מזהה MusicBrainz</div>
+    <div class="stats">נמצאו {count} אמנים ללא מזהה MusicBrainz</div>
     
     <table class="artist-table">
         <thead>
@@ -228,31 +596,9 @@ def generate_html(artists, category_name):
         </thead>
         <tbody>
 """
-    
-    for i, artist in enumerate(artists, 1):
-        artist_name = artist['title']
-        wiki_url = f"https://he.wikipedia.org/wiki/{quote(artist_name)}"
-        musicbrainz_url = f"https://musicbrainz.org/search?query={quote(artist_name)}&type=artist&method=indexed"
-        
-        # Wikidata status
-        if artist['wikidata_id'] and artist['wikidata_id'] != 'error':
-            wikidata_cell = f'<a href="https://www.wikidata.org/wiki/{artist["wikidata_id"]}" target="_blank">{artist["wikidata_id"]}</a>'
-        elif artist['wikidata_id'] is None:
-            wikidata_cell = '<span class="no-wikidata">אין מזהה</span>'
-        else:
-            wikidata_cell = '<span class="no-wikidata">שגיאה</span>'
-        
-        html_content += f"""
-            <tr>
-                <td>{i}</td>
-                <td>{html.escape(artist_name)}</td>
-                <td><a href="{wiki_url}" target="_blank">לדף ויקיפדיה</a></td>
-                <td class="wikidata-status">{wikidata_cell}</td>
-                <td><a href="{musicbrainz_url}" target="_blank" class="musicbrainz-link">חיפוש והוספה</a></td>
-            </tr>
-"""
-    
-    html_content += """
+
+# End of the HTML page, after the table rows
+HTML_FOOTER = """
         </tbody>
     </table>
     
@@ -263,35 +609,93 @@ def generate_html(artists, category_name):
 </body>
 </html>
 """
+
+def title_sort_key(artist):
+    """
+    Get the key to sort an artist by its title with
+    """
+    if COLLATOR is not None:
+        return COLLATOR.getSortKey(artist['title'])
+    
+    return artist['title']
+
+def write_html(file, artists, category_name):
+    """
+    Write an HTML page with artist links (only those without MusicBrainz)
+
+    The page is written row by row to the given file, so it is never
+    held in memory as a whole
+    """
+    file.write(HTML_HEADER_TEMPLATE.format(
+        category_name=html.escape(category_name),
+        count=len(artists)
+    ))
     
-    return html_content
+    for i, artist in enumerate(artists, 1):
+        artist_name = html.escape(artist['title'])
+        quoted_name = quote(artist['title'])
+        
+        # Wikidata status
+        if artist['wikidata_id'] and artist['wikidata_id'] != 'error':
+            wikidata_cell = WIKIDATA_CELL_TEMPLATE.format(wikidata_id=artist['wikidata_id'])
+        elif artist['wikidata_id'] is None:
+            wikidata_cell = '<span class="no-wikidata">אין מזהה</span>'
+        else:
+            wikidata_cell = '<span class="no-wikidata">שגיאה</span>'
+        
+        file.write(ROW_TEMPLATE.format_map({
+            'i': i,
+            'name': artist_name,
+            'quoted_name': quoted_name,
+            'wikidata_cell': wikidata_cell
+        }))
+    
+    file.write(HTML_FOOTER)
 
-def main():
+async def main():
     # You can change this to any category name
     category_name = "זמרים_ישראלים"  # Remove the "קטגוריה:" prefix
     
     print(f"Fetching artists from category: {category_name}")
     
-    # Get all artists from the category
-    all_artists = get_category_members(category_name)
-    
-    print(f"Found {len(all_artists)} total artists")
-    
-    # Filter to only those without MusicBrainz IDs
-    artists_without_mb = filter_artists_without_musicbrainz(all_artists)
+    async with create_session() as session:
+        try:
+            # Let the query service do the whole lookup in one request
+            artists_without_mb = await fetch_artists_without_mb_sparql(session, category_name)
+        except Exception as e:
+            print(f"SPARQL query failed ({e}), falling back to the APIs")
+            
+            # Get all artists from the category, with their Wikidata IDs
+            all_artists = await get_category_members(session, category_name)
+            
+            print(f"Found {len(all_artists)} total artists")
+            
+            # The cache only speeds things up, so carry on without it
+            try:
+                cache = LookupCache()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Could not open the lookup cache ({e}), continuing without it")
+                cache = None
+            
+            # Filter to only those without MusicBrainz IDs
+            try:
+                artists_without_mb = await filter_artists_without_musicbrainz(
+                    session, all_artists, cache=cache
+                )
+            finally:
+                if cache is not None:
+                    cache.close()
     
     print(f"\nFound {len(artists_without_mb)} artists without MusicBrainz IDs")
     
-    # Sort artists alphabetically by Hebrew name
-    artists_without_mb.sort(key=lambda x: x['title'])
-    
-    # Generate HTML
-    html_content = generate_html(artists_without_mb, category_name)
+    # Sort artists alphabetically by Hebrew name. Results from the SPARQL
+    # query usually come in this order already, which keeps the sort cheap
+    artists_without_mb.sort(key=title_sort_key)
     
-    # Save to file
+    # Generate HTML and save it to file
     output_filename = f"{category_name}_without_musicbrainz.html"
-    with open(output_filename, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    with open(output_filename, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        write_html(f, artists_without_mb, category_name)
     
     print(f"\nHTML file saved as: {output_filename}")
     
@@ -302,4 +706,4 @@ def main():
         print(f"- {artist['title']} (Wikidata: {status})")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())